@@ -10,6 +10,18 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY", "").strip()
 MONGO_URI = os.getenv("MONGO_URI", "").strip()
 DB_NAME = os.getenv("DB_NAME", "quiz_app").strip()
 GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant").strip()
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "4"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+GROQ_RETRY_BASE_SECONDS = float(os.getenv("GROQ_RETRY_BASE_SECONDS", "1"))
+QUIZ_BATCH_MAX_ITEMS = int(os.getenv("QUIZ_BATCH_MAX_ITEMS", "20"))
+QUIZ_MAX_QUESTIONS = int(os.getenv("QUIZ_MAX_QUESTIONS", "50"))
+LEADERBOARD_POLL_SECONDS = float(os.getenv("LEADERBOARD_POLL_SECONDS", "2"))
+LEADERBOARD_KEEPALIVE_SECONDS = float(os.getenv("LEADERBOARD_KEEPALIVE_SECONDS", "15"))
+LEADERBOARD_MAX_STREAMS = int(os.getenv("LEADERBOARD_MAX_STREAMS", "16"))
+DRAFT_FLUSH_SECONDS = float(os.getenv("DRAFT_FLUSH_SECONDS", "5"))
+DRAFT_MAX_PENDING = int(os.getenv("DRAFT_MAX_PENDING", "1000"))
+DRAFT_MAX_RETRIES = int(os.getenv("DRAFT_MAX_RETRIES", "3"))
+DRAFT_TTL_SECONDS = int(os.getenv("DRAFT_TTL_SECONDS", "86400"))
 
 if MONGO_URI:
     # Print a masked version of the URI to help debug without exposing secrets
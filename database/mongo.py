@@ -23,4 +23,4 @@ quizzes_collection = db["quizzes"] if db is not None else None
 quiz_results_collection = db["quiz_results"] if db is not None else None
 enrollments_collection = db["enrollments"] if db is not None else None
 submissions_collection = db["submissions"] if db is not None else None
-
+quiz_drafts_collection = db["quiz_drafts"] if db is not None else None
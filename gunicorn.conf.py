@@ -0,0 +1,17 @@
+import os
+
+# The live leaderboard (/staff/results/<course_id>/stream) keeps one request
+# open per connected dashboard. With the default sync worker a single stream
+# would block the whole worker, so threads serve streams and regular API
+# requests side by side. Keep LEADERBOARD_MAX_STREAMS below `threads` so
+# dashboards can never take every thread.
+#
+# Keep a single worker process: the Groq concurrency budget, the leaderboard
+# rankings and the draft-answer buffer all live in process memory, and with
+# several workers each would get its own copy (N x the Groq budget, autosaves
+# invisible to a submit handled by another worker). Scale with threads.
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "gthread"
+workers = 1
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+timeout = 120
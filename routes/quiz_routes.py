@@ -1,10 +1,16 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import get_jwt_identity, jwt_required, get_jwt
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_jwt_extended import get_jwt_identity, jwt_required, get_jwt, verify_jwt_in_request
 from utils.decorators import staff_required, student_required
-from services.quiz_service import generate_quiz_from_pdf
+from services.quiz_service import generate_quiz_from_pdf, generate_quizzes_batch
+from services import leaderboard_service
+from services.result_service import encode_result_details, expand_result_details
+from services import draft_service
 from database.mongo import quizzes_collection, quiz_results_collection
 from bson import ObjectId
 from datetime import datetime
+import json
+import queue
+import config
 
 quiz_bp = Blueprint("quiz", __name__)
 
@@ -68,6 +74,78 @@ def staff_upload_quiz():
         return jsonify({"message": str(e)}), 500
 
 
+# ---------------- STAFF BATCH UPLOAD QUIZZES ----------------
+@quiz_bp.route("/staff/quiz/upload/batch", methods=["POST"])
+@staff_required
+def staff_upload_quiz_batch():
+    pdf_files = request.files.getlist("pdfs") or request.files.getlist("pdf")
+    if not pdf_files:
+        return jsonify({"message": "No PDF uploaded"}), 400
+
+    course_id = request.form.get("course_id")
+    course_outcomes_json = request.form.get("course_outcomes")
+    identity = get_jwt_identity()
+
+    if not course_id:
+        return jsonify({"message": "Course ID is required"}), 400
+
+    # Variants: JSON list of {"title", "num_questions"}; defaults to the single-upload fields
+    variants_json = request.form.get("variants")
+    if variants_json:
+        try:
+            variants = json.loads(variants_json)
+            if not isinstance(variants, list) or not all(isinstance(v, dict) for v in variants):
+                raise ValueError
+            for v in variants:
+                if not isinstance(v.get("title") or "", str) or isinstance(v.get("num_questions"), bool):
+                    raise ValueError
+                v["num_questions"] = int(v.get("num_questions") or 10)
+        except (ValueError, TypeError):
+            return jsonify({"message": "variants must be a JSON list of {title, num_questions} objects"}), 400
+    else:
+        variants = [{
+            "title": request.form.get("title") or "Untitled Quiz",
+            "num_questions": request.form.get("num_questions", default=10, type=int)
+        }]
+
+    if not variants:
+        return jsonify({"message": "At least one variant is required"}), 400
+
+    if not all(1 <= v["num_questions"] <= config.QUIZ_MAX_QUESTIONS for v in variants):
+        return jsonify({"message": f"num_questions must be between 1 and {config.QUIZ_MAX_QUESTIONS}"}), 400
+
+    if len(pdf_files) * len(variants) > config.QUIZ_BATCH_MAX_ITEMS:
+        return jsonify({"message": f"Batch too large: at most {config.QUIZ_BATCH_MAX_ITEMS} quizzes per request"}), 400
+
+    try:
+        items = generate_quizzes_batch(
+            pdf_files,
+            created_by=identity,
+            course_id=course_id,
+            variants=variants,
+            course_outcomes_json=course_outcomes_json
+        )
+
+        succeeded = sum(1 for item in items if item["status"] == "ok")
+        if succeeded:
+            status = 200
+        elif all(item.get("stage") == "preprocessing" for item in items):
+            # Every failure was an unreadable/empty PDF: the client's fault
+            status = 400
+        else:
+            status = 500
+        return jsonify({
+            "message": f"Generated {succeeded} of {len(items)} quizzes",
+            "course_id": course_id,
+            "results": items
+        }), status
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"message": str(e)}), 500
+
+
 # ---------------- STAFF GET QUIZ BY ID ----------------
 @quiz_bp.route("/staff/quiz/<quiz_id>", methods=["GET"])
 @staff_required
@@ -119,34 +197,7 @@ def get_course_results(course_id):
             combined_targets = list(set(target_ids_str + target_ids_obj))
 
             # 2. Aggregation Pipeline
-            pipeline = [
-                # Match results that belong to any of the course's quizzes
-                {"$match": {"quiz_id": {"$in": combined_targets}}},
-                
-                # Convert student_id (string) to ObjectId for the lookup
-                {"$addFields": {
-                    "student_oid": {
-                        "$cond": {
-                            "if": {"$eq": [{"$type": "$student_id"}, "string"]},
-                            "then": {"$toObjectId": "$student_id"},
-                            "else": "$student_id"
-                        }
-                    }
-                }},
-                
-                # Join with users collection to get student names
-                {"$lookup": {
-                    "from": "users", 
-                    "localField": "student_oid",
-                    "foreignField": "_id",
-                    "as": "user_data"
-                }},
-                
-                {"$unwind": {"path": "$user_data", "preserveNullAndEmptyArrays": True}},
-                
-                # Sort by score/percentage descending (Leaderboard style)
-                {"$sort": {"percentage": -1, "score": -1}}
-            ]
+            pipeline = leaderboard_service.course_results_pipeline(combined_targets)
 
             results_list = list(quiz_results_collection.aggregate(pipeline))
 
@@ -179,6 +230,78 @@ def get_course_results(course_id):
     return fetch_data()
 
 
+# --- STAFF: LIVE LEADERBOARD (Server-Sent Events)
+@quiz_bp.route("/staff/results/<course_id>/stream", methods=["GET"])
+def stream_course_results(course_id):
+    # EventSource cannot send headers, so only this view reads the token from ?jwt=
+    verify_jwt_in_request(locations=["query_string"])
+    if get_jwt().get("role") != "staff":
+        return jsonify({"msg": "Staff access required"}), 403
+
+    try:
+        subscription, snapshot = leaderboard_service.subscribe(course_id)
+    except leaderboard_service.StreamLimitReached as e:
+        return jsonify({"msg": str(e)}), 503
+    except Exception as e:
+        print(f"DEBUG ERROR: {str(e)}")
+        return jsonify({"msg": "Error", "error": str(e)}), 500
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def events():
+        try:
+            # Full ranking once, then one small delta per new submission
+            yield sse("snapshot", {"results": snapshot})
+            while True:
+                try:
+                    delta = subscription.get(timeout=config.LEADERBOARD_KEEPALIVE_SECONDS)
+                    yield sse("delta", delta)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            leaderboard_service.unsubscribe(course_id, subscription)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# --- STAFF: SINGLE RESULT WITH FULL DETAILS
+@quiz_bp.route("/staff/result/<result_id>", methods=["GET"])
+@staff_required
+def get_result_details(result_id):
+    try:
+        obj_id = ObjectId(result_id)
+    except Exception:
+        return jsonify({"message": "Invalid result ID format"}), 400
+
+    result = quiz_results_collection.find_one({"_id": obj_id})
+    if not result:
+        return jsonify({"message": "Result not found"}), 404
+
+    try:
+        quiz = quizzes_collection.find_one({"_id": ObjectId(str(result.get("quiz_id")))})
+    except Exception:
+        # Legacy results may carry a missing or malformed quiz_id
+        quiz = None
+    submitted_at = result.get("submitted_at")
+
+    return jsonify({
+        "result_id": str(result["_id"]),
+        "quiz_id": str(result.get("quiz_id")),
+        "quiz_title": quiz.get("title", "Untitled Quiz") if quiz else "Untitled Quiz",
+        "student_id": str(result.get("student_id")),
+        "score": result.get("score", 0),
+        "total": result.get("total_questions") or result.get("total") or 10,
+        "percentage": result.get("percentage", 0),
+        "submitted_at": submitted_at.isoformat() if isinstance(submitted_at, datetime) else submitted_at,
+        "details": expand_result_details(result, quiz)
+    }), 200
+
+
 # ---------------- STUDENT ROUTES ----------------
 @quiz_bp.route("/student/quizzes", methods=["GET"])
 @student_required
@@ -229,7 +352,48 @@ def get_student_quiz_by_id(quiz_id):
         q_copy["question_id"] = str(idx)
         sanitized.append(q_copy)
 
-    return jsonify({"submitted": False, "questions": sanitized}), 200
+    return jsonify({
+        "submitted": False,
+        "questions": sanitized,
+        "draft_answers": draft_service.get_draft(student_id, quiz_id)
+    }), 200
+
+
+# --- STUDENT: AUTOSAVE DRAFT ANSWERS ---
+@quiz_bp.route("/student/quiz/<quiz_id>/draft", methods=["PUT"])
+@student_required
+def save_draft_answers(quiz_id):
+    try:
+        obj_id = ObjectId(quiz_id)
+    except Exception:
+        return jsonify({"message": "Invalid ID"}), 400
+
+    # Only real question IDs are accepted, so buffer and draft size stay bounded per quiz
+    total = draft_service.question_count(obj_id)
+    if total is None:
+        return jsonify({"message": "Quiz not found"}), 404
+
+    data = request.get_json(force=True, silent=True) or {}
+    answers = data.get("answers")
+    if not isinstance(answers, dict) or not all(str(k).isdigit() and int(k) < total for k in answers):
+        return jsonify({"message": "answers must map question IDs to answers"}), 400
+    if not all(v is None or (isinstance(v, (str, int)) and not isinstance(v, bool)) for v in answers.values()):
+        return jsonify({"message": "Each answer must be a string, an integer or null"}), 400
+
+    student_id = get_jwt_identity()
+    # Late autosaves would otherwise re-create a draft after submission
+    if quiz_results_collection.find_one({"quiz_id": obj_id, "student_id": student_id}, {"_id": 1}):
+        return jsonify({"submitted": True, "message": "Already submitted"}), 403
+
+    draft_service.save_draft(student_id, quiz_id, {str(k): v for k, v in answers.items()})
+    return jsonify({"message": "Draft saved"}), 202
+
+
+@quiz_bp.route("/student/quiz/<quiz_id>/draft", methods=["GET"])
+@student_required
+def get_draft_answers(quiz_id):
+    student_id = get_jwt_identity()
+    return jsonify({"answers": draft_service.get_draft(student_id, quiz_id)}), 200
 
 
 # --- STUDENT: SUBMIT QUIZ ---
@@ -249,9 +413,12 @@ def submit_quiz_answers(quiz_id):
         if not quiz: 
             return jsonify({"message": "Quiz not found"}), 404
 
-        # Get user answers from request
-        data = request.get_json(force=True)
-        user_answers = data.get("answers", {})
+        # Autosaved draft first; anything sent with the submission overrides it.
+        # This worker's unwritten autosaves are flushed so the read below sees them.
+        data = request.get_json(force=True, silent=True) or {}
+        draft_service.flush_draft(student_id, quiz_id)
+        user_answers = draft_service.get_draft(student_id, quiz_id)
+        user_answers.update(data.get("answers") or {})
         
         print("\n" + "="*80)
         print("SUBMISSION RECEIVED")
@@ -290,8 +457,9 @@ def submit_quiz_answers(quiz_id):
             "total_questions": total,
             "percentage": percentage,
             "submitted_at": datetime.utcnow(),
-            "details": results
+            **encode_result_details(quiz, results)
         })
+        draft_service.discard_draft(student_id, quiz_id)
         
         print(f"\n✅ FINAL SCORE: {correct}/{total} ({percentage}%)\n")
         
@@ -0,0 +1,198 @@
+import atexit
+import threading
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from config import DRAFT_FLUSH_SECONDS, DRAFT_MAX_PENDING, DRAFT_MAX_RETRIES, DRAFT_TTL_SECONDS
+from database.mongo import quiz_drafts_collection, quizzes_collection
+
+
+# Autosaved answers are coalesced per (student, quiz) in memory and written
+# with one bulk_write every DRAFT_FLUSH_SECONDS, so each student costs at most
+# one upsert per interval no matter how often the frontend saves.
+#
+# The buffer lives in process memory, so the app must run as a single process
+# (see gunicorn.conf.py). With several workers, autosaves buffered by one
+# worker are invisible to a submit handled by another and would be graded as
+# blank, and two workers flushing the same draft could write an older answer
+# over a newer one. Within the process at most one write per draft is in
+# flight at a time, so stored values never go backwards. Drafts that are never
+# submitted expire through the TTL index.
+
+_pending = {}       # (student_id, quiz_id) -> {question_id: answer}, not yet written
+_inflight = {}      # same shape, currently being written
+_discarded = set()  # keys submitted while their write was in flight
+_failures = {}      # key -> consecutive write errors
+_question_counts = {}  # quiz_id -> number of questions (quizzes never change)
+_lock = threading.Lock()
+_settled = threading.Condition(_lock)  # notified whenever in-flight writes finish
+_flushing = False
+_wake = threading.Event()
+_flusher = None
+
+def _draft_filter(student_id, quiz_id):
+    return {"student_id": student_id, "quiz_id": str(quiz_id)}
+
+def _upsert(key, answers, now):
+    student_id, quiz_id = key
+    fields = {f"answers.{q_id}": ans for q_id, ans in answers.items()}
+    fields["updated_at"] = now
+    return UpdateOne(_draft_filter(student_id, quiz_id), {"$set": fields}, upsert=True)
+
+def _requeue(key, answers):
+    """Puts a failed write back unless it keeps failing (called under _lock)."""
+    _failures[key] = _failures.get(key, 0) + 1
+    if _failures[key] > DRAFT_MAX_RETRIES:
+        print(f"❌ ERROR: Dropping draft for {key} after {DRAFT_MAX_RETRIES} failed writes")
+        _failures.pop(key, None)
+        return
+    # Anything saved since the swap is newer than the failed batch.
+    _pending[key] = {**answers, **_pending.get(key, {})}
+
+def flush_drafts():
+    """Writes every buffered draft with a single bulk_write of upserts."""
+    global _flushing
+    with _lock:
+        if _flushing:
+            return 0
+        # A draft already being written waits for the next round, keeping writes per draft in order.
+        batch = {key: answers for key, answers in _pending.items() if key not in _inflight}
+        if not batch:
+            return 0
+        for key in batch:
+            del _pending[key]
+        _inflight.update(batch)
+        _flushing = True
+
+    now = datetime.utcnow()
+    keys = list(batch)
+    failed = {}
+    try:
+        quiz_drafts_collection.bulk_write([_upsert(key, batch[key], now) for key in keys], ordered=False)
+    except BulkWriteError as e:
+        # ordered=False: everything except the listed ops was written.
+        for err in e.details.get("writeErrors", []):
+            failed[keys[err["index"]]] = err.get("errmsg")
+        print(f"❌ ERROR: {len(failed)} draft writes failed: {list(failed.values())[:3]}")
+    except PyMongoError as e:
+        print(f"❌ ERROR: Draft flush failed, will retry: {e}")
+        failed = {key: str(e) for key in keys}
+
+    with _lock:
+        for key in keys:
+            if key in _discarded:
+                continue
+            if key in failed:
+                _requeue(key, batch[key])
+            else:
+                _failures.pop(key, None)
+        discarded = [key for key in keys if key in _discarded and key not in failed]
+        _discarded.difference_update(keys)
+        for key in keys:
+            _inflight.pop(key, None)
+        _flushing = False
+        _settled.notify_all()
+
+    # Quizzes submitted mid-flush: remove the drafts this batch just re-created.
+    for student_id, quiz_id in discarded:
+        try:
+            quiz_drafts_collection.delete_one(_draft_filter(student_id, quiz_id))
+        except PyMongoError as e:
+            print(f"❌ ERROR: Could not remove submitted draft: {e}")
+    return len(keys) - len(failed)
+
+def _run_flusher():
+    while True:
+        _wake.wait(DRAFT_FLUSH_SECONDS)
+        _wake.clear()
+        flush_drafts()
+
+def _ensure_indexes():
+    try:
+        quiz_drafts_collection.create_index([("student_id", ASCENDING), ("quiz_id", ASCENDING)], unique=True)
+        # Drafts that are never submitted expire on their own.
+        quiz_drafts_collection.create_index("updated_at", expireAfterSeconds=DRAFT_TTL_SECONDS)
+    except PyMongoError as e:
+        print(f"⚠️  Could not create quiz_drafts indexes: {e}")
+
+def _ensure_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_run_flusher, name="draft-flusher", daemon=True)
+        _flusher.start()
+    _ensure_indexes()
+    atexit.register(flush_drafts)
+
+def save_draft(student_id, quiz_id, answers):
+    """Buffers a partial answer map; later values for a question win."""
+    _ensure_flusher()
+    with _lock:
+        key = (student_id, str(quiz_id))
+        _discarded.discard(key)
+        _pending.setdefault(key, {}).update(answers)
+        if len(_pending) >= DRAFT_MAX_PENDING:
+            _wake.set()
+
+def _buffered(key):
+    """In-flight then pending answers for one key (called under _lock)."""
+    return {**_inflight.get(key, {}), **_pending.get(key, {})}
+
+def get_draft(student_id, quiz_id):
+    """Returns the stored draft merged with any not-yet-written answers."""
+    key = (student_id, str(quiz_id))
+    # Copy the buffer before reading Mongo: a write finishing in between is
+    # then covered by one side or the other. Buffered values are never older
+    # than the stored ones because each draft has at most one write in flight.
+    with _lock:
+        buffered = _buffered(key)
+    doc = quiz_drafts_collection.find_one(_draft_filter(student_id, quiz_id), {"answers": 1})
+    answers = dict(doc.get("answers", {})) if doc else {}
+    answers.update(buffered)
+    return answers
+
+def flush_draft(student_id, quiz_id):
+    """Writes this process's pending answers for one draft right away."""
+    key = (student_id, str(quiz_id))
+    with _lock:
+        # Let an older background write of this draft land first.
+        while key in _inflight:
+            _settled.wait()
+        answers = _pending.pop(key, None)
+        if not answers:
+            return
+        _inflight[key] = answers
+
+    try:
+        quiz_drafts_collection.bulk_write([_upsert(key, answers, datetime.utcnow())])
+    except PyMongoError:
+        with _lock:
+            _pending[key] = {**answers, **_pending.get(key, {})}
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+            _settled.notify_all()
+
+def question_count(quiz_id):
+    """Number of questions in a quiz, or None if it does not exist."""
+    key = str(quiz_id)
+    if key not in _question_counts:
+        quiz = quizzes_collection.find_one({"_id": ObjectId(key)}, {"questions.question_id": 1})
+        if not quiz:
+            return None
+        _question_counts[key] = len(quiz.get("questions", []))
+    return _question_counts[key]
+
+def discard_draft(student_id, quiz_id):
+    """Drops a draft once its quiz has been submitted."""
+    key = (student_id, str(quiz_id))
+    with _lock:
+        _pending.pop(key, None)
+        _failures.pop(key, None)
+        if key in _inflight:
+            # The running flush will delete it again after its upsert lands.
+            _discarded.add(key)
+    quiz_drafts_collection.delete_one(_draft_filter(student_id, quiz_id))
@@ -0,0 +1,325 @@
+import bisect
+import queue
+import threading
+import time
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+from config import LEADERBOARD_POLL_SECONDS, LEADERBOARD_MAX_STREAMS
+from database.mongo import quizzes_collection, quiz_results_collection, users_collection
+
+
+class StreamLimitReached(Exception):
+    pass
+
+
+# --- LOOKUP CACHES ---
+# Quiz titles/courses and usernames never change during an exam, so each is
+# fetched once instead of re-joined on every submission.
+
+_quiz_cache = {}
+_user_cache = {}
+
+def _quiz_info(quiz_id):
+    """Returns (course_id, title) for a quiz id stored as string or ObjectId."""
+    key = str(quiz_id)
+    if key not in _quiz_cache:
+        try:
+            quiz = quizzes_collection.find_one({"_id": ObjectId(key)}, {"course_id": 1, "title": 1})
+        except Exception:
+            quiz = None
+        _quiz_cache[key] = (quiz.get("course_id"), quiz.get("title", "Untitled Quiz")) if quiz else (None, "Untitled Quiz")
+    return _quiz_cache[key]
+
+def _username(student_id):
+    key = str(student_id)
+    if key not in _user_cache:
+        try:
+            user = users_collection.find_one({"_id": ObjectId(key)}, {"username": 1})
+        except Exception:
+            user = None
+        _user_cache[key] = user.get("username", "Unknown Student") if user else "Unknown Student"
+    return _user_cache[key]
+
+def _number(value):
+    """Legacy results may hold None or strings in score/percentage."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def course_results_pipeline(targets):
+    """Results for the given quiz ids joined with usernames, best first."""
+    return [
+        # Match results that belong to any of the course's quizzes
+        {"$match": {"quiz_id": {"$in": targets}}},
+
+        # Convert student_id (string) to ObjectId for the lookup
+        {"$addFields": {
+            "student_oid": {
+                "$cond": {
+                    "if": {"$eq": [{"$type": "$student_id"}, "string"]},
+                    "then": {"$toObjectId": "$student_id"},
+                    "else": "$student_id"
+                }
+            }
+        }},
+
+        # Join with users collection to get student names
+        {"$lookup": {
+            "from": "users",
+            "localField": "student_oid",
+            "foreignField": "_id",
+            "as": "user_data"
+        }},
+
+        {"$unwind": {"path": "$user_data", "preserveNullAndEmptyArrays": True}},
+
+        # Sort by score/percentage descending (Leaderboard style)
+        {"$sort": {"percentage": -1, "score": -1}}
+    ]
+
+def format_result_entry(res, username=None, quiz_title=None):
+    """Same shape as the rows returned by /staff/results/<course_id>."""
+    submitted_at = res.get("submitted_at")
+    return {
+        "result_id": str(res["_id"]),
+        "username": username or _username(res.get("student_id")),
+        "quiz_title": quiz_title or _quiz_info(res.get("quiz_id"))[1],
+        "score": res.get("score", 0),
+        "total": res.get("total_questions") or res.get("total") or 10,
+        "percentage": res.get("percentage", 0),
+        "submitted_at": submitted_at.isoformat() if isinstance(submitted_at, datetime) else submitted_at
+    }
+
+
+# --- PER-COURSE RANKING ---
+
+class CourseLeaderboard:
+    """In-memory ranking for one course plus the queues of connected viewers."""
+
+    def __init__(self, course_id):
+        self.course_id = course_id
+        self.keys = []       # sorted (-percentage, -score, result_id)
+        self.entries = {}    # result_id -> formatted entry
+        self.subscribers = []
+        # While seeding, inserts seen by the watcher wait here instead of being dropped
+        self.loading = True
+        self.backlog = []
+        self.ready = threading.Event()
+        self.failed = False
+
+    def add_entry(self, entry):
+        """Ranks a formatted entry and returns its delta, or None if already ranked."""
+        if entry["result_id"] in self.entries:
+            return None
+        key = (-_number(entry["percentage"]), -_number(entry["score"]), entry["result_id"])
+        rank = bisect.bisect_left(self.keys, key)
+        self.keys.insert(rank, key)
+        self.entries[entry["result_id"]] = entry
+        return {"type": "insert", "rank": rank, "entry": entry}
+
+    def snapshot(self):
+        return [self.entries[key[2]] for key in self.keys]
+
+
+_boards = {}
+_lock = threading.Lock()
+_watcher = None
+_watcher_ready = threading.Event()
+
+def _seed_entries(course_id):
+    """Loads a course's existing results with one aggregation (no lock held)."""
+    course_quizzes = list(quizzes_collection.find({"course_id": course_id}, {"_id": 1, "title": 1}))
+    if not course_quizzes:
+        return []
+
+    quiz_titles = {}
+    for q in course_quizzes:
+        quiz_titles[str(q["_id"])] = q.get("title", "Untitled Quiz")
+        _quiz_cache[str(q["_id"])] = (course_id, q.get("title", "Untitled Quiz"))
+    targets = list(set([q["_id"] for q in course_quizzes] + list(quiz_titles)))
+
+    entries = []
+    for res in quiz_results_collection.aggregate(course_results_pipeline(targets)):
+        username = (res.get("user_data") or {}).get("username", "Unknown Student")
+        _user_cache.setdefault(str(res.get("student_id")), username)
+        entries.append(format_result_entry(res, username, quiz_titles.get(str(res.get("quiz_id")))))
+    return entries
+
+def _publish(res):
+    course_id = _quiz_info(res.get("quiz_id"))[0]
+    if course_id not in _boards:
+        # Nobody is watching this course; it will be seeded on first connect.
+        return
+    entry = format_result_entry(res)
+    with _lock:
+        board = _boards.get(course_id)
+        if board is not None:
+            _apply_entry(board, entry)
+
+def _apply_entry(board, entry):
+    """Ranks an entry and pushes its delta to viewers (called under _lock)."""
+    if board.loading:
+        board.backlog.append(entry)
+        return
+    delta = board.add_entry(entry)
+    if delta is None:
+        return
+    for q in board.subscribers:
+        q.put(delta)
+
+def _reseed_open_boards():
+    """Re-reads every watched course after the change stream lost its position."""
+    for course_id in list(_boards):
+        try:
+            entries = _seed_entries(course_id)
+        except Exception as e:
+            print(f"❌ ERROR: Could not reseed leaderboard for {course_id}: {e}")
+            continue
+        with _lock:
+            board = _boards.get(course_id)
+            if board is None:
+                continue
+            # Already-ranked results are skipped, so only missed inserts become deltas
+            for entry in entries:
+                _apply_entry(board, entry)
+
+def _safe_publish(res):
+    # A malformed document must not take the watcher thread down with it.
+    try:
+        _publish(res)
+    except Exception as e:
+        print(f"❌ ERROR: Skipping result {res.get('_id')} in leaderboard: {e}")
+
+
+# --- WATCHER ---
+# The stream (or tail position) is established before _watcher_ready is set,
+# and courses are only seeded after that, so no insert falls in between.
+
+_resume_token = None
+_last_id = None
+_needs_reseed = False
+
+# Standalone servers reject change streams with this code; nothing else means "unsupported".
+_CHANGE_STREAMS_UNSUPPORTED = 40573
+# InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost: the position is gone.
+_RESUME_POSITION_LOST = {260, 280, 286}
+
+def _change_streams_unsupported(e):
+    return e.code == _CHANGE_STREAMS_UNSUPPORTED or "only supported on replica sets" in str(e)
+
+def _watch_change_stream():
+    global _resume_token, _needs_reseed
+    pipeline = [{"$match": {"operationType": "insert"}}]
+    with quiz_results_collection.watch(pipeline, resume_after=_resume_token) as stream:
+        _watcher_ready.set()
+        if _needs_reseed:
+            # The new stream is open, so a reseed now covers everything missed in the gap.
+            _needs_reseed = False
+            _reseed_open_boards()
+        for change in stream:
+            _resume_token = stream.resume_token
+            _safe_publish(change.get("fullDocument") or {})
+
+def _tail_by_id():
+    """Fallback for standalone servers: poll for results newer than the last seen _id."""
+    global _last_id
+    if _last_id is None:
+        latest = quiz_results_collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        _last_id = latest["_id"] if latest else ObjectId.from_datetime(datetime.utcnow())
+    _watcher_ready.set()
+    while True:
+        for res in quiz_results_collection.find({"_id": {"$gt": _last_id}}).sort("_id", 1):
+            _last_id = res["_id"]
+            _safe_publish(res)
+        time.sleep(LEADERBOARD_POLL_SECONDS)
+
+def _run_watcher():
+    global _resume_token, _needs_reseed
+    use_change_stream = True
+    while True:
+        try:
+            if use_change_stream:
+                _watch_change_stream()
+            else:
+                _tail_by_id()
+        except OperationFailure as e:
+            if use_change_stream and _change_streams_unsupported(e):
+                # Change streams need a replica set; standalone servers raise here.
+                print(f"⚠️  Change streams unavailable ({e}); tailing quiz_results by _id instead.")
+                use_change_stream = False
+                continue
+            if use_change_stream and e.code in _RESUME_POSITION_LOST:
+                print(f"⚠️  Leaderboard change stream lost its position ({e}); reopening and reseeding.")
+                _resume_token = None
+                _needs_reseed = True
+            else:
+                print(f"❌ ERROR: Leaderboard watcher failed, retrying: {e}")
+        except Exception as e:
+            print(f"❌ ERROR: Leaderboard watcher failed, restarting: {e}")
+        time.sleep(LEADERBOARD_POLL_SECONDS)
+
+def _ensure_watcher():
+    global _watcher
+    with _lock:
+        if _watcher is None:
+            _watcher = threading.Thread(target=_run_watcher, name="leaderboard-watcher", daemon=True)
+            _watcher.start()
+    if not _watcher_ready.wait(timeout=10):
+        print("⚠️  Leaderboard watcher is not ready yet; live updates may be delayed.")
+
+
+# --- SUBSCRIPTIONS ---
+
+def subscribe(course_id):
+    """Registers a viewer; returns (queue, current ranking)."""
+    _ensure_watcher()
+    q = queue.Queue()
+    with _lock:
+        if sum(len(b.subscribers) for b in _boards.values()) >= LEADERBOARD_MAX_STREAMS:
+            raise StreamLimitReached(f"At most {LEADERBOARD_MAX_STREAMS} live leaderboards per worker")
+        board = _boards.get(course_id)
+        seeding = board is None
+        if seeding:
+            board = _boards[course_id] = CourseLeaderboard(course_id)
+        board.subscribers.append(q)
+
+    if not seeding:
+        board.ready.wait()
+        with _lock:
+            if board.failed:
+                raise Exception("Failed to load course results")
+            # Anything queued before now is already part of the snapshot
+            while not q.empty():
+                q.get_nowait()
+            return q, board.snapshot()
+
+    try:
+        # The aggregation runs without the lock; inserts meanwhile go to the backlog.
+        entries = _seed_entries(course_id)
+    except Exception:
+        with _lock:
+            board.failed = True
+            _boards.pop(course_id, None)
+        board.ready.set()
+        raise
+
+    with _lock:
+        for entry in entries + board.backlog:
+            board.add_entry(entry)
+        board.backlog = []
+        board.loading = False
+        board.ready.set()
+        return q, board.snapshot()
+
+def unsubscribe(course_id, q):
+    with _lock:
+        board = _boards.get(course_id)
+        if board is None:
+            return
+        if q in board.subscribers:
+            board.subscribers.remove(q)
+        if not board.subscribers:
+            # Drop idle rankings so memory tracks live dashboards only.
+            del _boards[course_id]
@@ -1,8 +1,12 @@
 import fitz
 import re
 import json
-from groq import Groq
-from config import GROQ_API_KEY, GROQ_MODEL
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from groq import Groq, RateLimitError
+from config import GROQ_API_KEY, GROQ_MODEL, GROQ_MAX_CONCURRENCY, GROQ_MAX_RETRIES, GROQ_RETRY_BASE_SECONDS
 from database.mongo import quizzes_collection
 from datetime import datetime
 from bson import ObjectId
@@ -32,23 +36,23 @@ def text_chunk_limit(text, max_tokens=2000):
 
 # --- CORE FUNCTIONS ---
 
-def generate_quiz_from_pdf(pdf_file, created_by, course_id, title, num_questions, course_outcomes_json):
-    try:
-        all_cos = json.loads(course_outcomes_json) if course_outcomes_json else []
-        
-        pdf_stream = pdf_file.read()
-        doc = fitz.open(stream=pdf_stream, filetype="pdf")
-        extracted_text = "".join(page.get_text() for page in doc)
-        doc.close()
-        
-        if not extracted_text.strip():
-            raise ValueError("The uploaded PDF seems to be empty or contains only images.")
-            
-    except Exception as e:
-        raise Exception(f"Preprocessing Error: {e}")
+# Shared budget for concurrent Groq calls, used by single and batch uploads alike.
+_llm_slots = threading.BoundedSemaphore(GROQ_MAX_CONCURRENCY)
+
+def extract_pdf_text(pdf_file):
+    """Reads an uploaded PDF once and returns its full text."""
+    pdf_stream = pdf_file.read()
+    doc = fitz.open(stream=pdf_stream, filetype="pdf")
+    extracted_text = "".join(page.get_text() for page in doc)
+    doc.close()
 
+    if not extracted_text.strip():
+        raise ValueError("The uploaded PDF seems to be empty or contains only images.")
+    return extracted_text
+
+def build_quiz_prompt(extracted_text, course_id, num_questions, all_cos):
     # IMPROVED PROMPT: Forces AI to provide the TEXT of the answer, not the index.
-    prompt = f"""
+    return f"""
 Generate exactly {num_questions} multiple choice questions from this text:
 {text_chunk_limit(extracted_text)}
 
@@ -63,48 +67,78 @@ STRICT RULES:
 4. Do NOT include prefixes like 'A)' or '1.' in the options or the answer.
 """
 
+def request_quiz_questions(prompt):
+    """Sends the prompt to Groq and returns the sanitized question list."""
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        try:
+            with _llm_slots:
+                response = groq_client.chat.completions.create(
+                    model=GROQ_MODEL,
+                    messages=[
+                        {"role": "system", "content": "You are a specialized JSON generator for academic assessments. You always provide the full text of the correct answer in the answer field."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.2
+                )
+            break
+        except RateLimitError as e:
+            if attempt == GROQ_MAX_RETRIES:
+                raise
+            # Back off outside the slot so other calls can use it; honour Retry-After when sent.
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = GROQ_RETRY_BASE_SECONDS * (2 ** attempt)
+            time.sleep(min(delay, 30) + random.uniform(0, 0.5))
+
+    raw_content = response.choices[0].message.content.strip()
+    start_idx = raw_content.find("[")
+    end_idx = raw_content.rfind("]")
+
+    if start_idx == -1 or end_idx == -1:
+        raise ValueError("AI response did not contain a JSON array.")
+
+    json_str = raw_content[start_idx : end_idx + 1]
+    quiz_data = json.loads(json_str)
+
+    sanitized_questions = []
+    for idx, q in enumerate(quiz_data):
+        clean_opts = [clean_string(opt) for opt in q.get("options", [])]
+        raw_ans = q.get("answer") or q.get("correct_answer")
+
+        sanitized_questions.append({
+            "question_id": str(idx),
+            "question": q.get("question"),
+            "options": clean_opts,
+            "answer": clean_string(raw_ans),
+            "co_tag": q.get("co_tag", "General")
+        })
+    return sanitized_questions
+
+def build_quiz_document(title, course_id, questions, created_by):
+    return {
+        "title": title,
+        "course_id": course_id,
+        "questions": questions,
+        "num_questions": len(questions),
+        "created_by": created_by,
+        "created_at": datetime.utcnow()
+    }
+
+def generate_quiz_from_pdf(pdf_file, created_by, course_id, title, num_questions, course_outcomes_json):
     try:
-        response = groq_client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a specialized JSON generator for academic assessments. You always provide the full text of the correct answer in the answer field."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2
-        )
-
-        raw_content = response.choices[0].message.content.strip()
-        start_idx = raw_content.find("[")
-        end_idx = raw_content.rfind("]")
-        
-        if start_idx == -1 or end_idx == -1:
-            raise ValueError("AI response did not contain a JSON array.")
-        
-        json_str = raw_content[start_idx : end_idx + 1]
-        quiz_data = json.loads(json_str)
+        all_cos = json.loads(course_outcomes_json) if course_outcomes_json else []
+        extracted_text = extract_pdf_text(pdf_file)
+    except Exception as e:
+        raise Exception(f"Preprocessing Error: {e}")
 
-        sanitized_questions = []
-        for idx, q in enumerate(quiz_data):
-            clean_opts = [clean_string(opt) for opt in q.get("options", [])]
-            raw_ans = q.get("answer") or q.get("correct_answer")
-            
-            sanitized_questions.append({
-                "question_id": str(idx),
-                "question": q.get("question"),
-                "options": clean_opts,
-                "answer": clean_string(raw_ans),
-                "co_tag": q.get("co_tag", "General")
-            })
+    prompt = build_quiz_prompt(extracted_text, course_id, num_questions, all_cos)
+
+    try:
+        sanitized_questions = request_quiz_questions(prompt)
+        quiz_document = build_quiz_document(title, course_id, sanitized_questions, created_by)
 
-        quiz_document = {
-            "title": title,
-            "course_id": course_id,
-            "questions": sanitized_questions,
-            "num_questions": len(sanitized_questions),
-            "created_by": created_by,
-            "created_at": datetime.utcnow()
-        }
-        
         result = quizzes_collection.insert_one(quiz_document)
 
         return {
@@ -117,6 +151,87 @@ STRICT RULES:
     except Exception as e:
         raise Exception(f"Quiz Generation Error: {str(e)}")
 
+def generate_quizzes_batch(pdf_files, created_by, course_id, variants, course_outcomes_json):
+    """
+    Generates one quiz per (PDF, variant) pair. Each PDF is extracted once,
+    the Groq calls run concurrently under the shared slot budget, and every
+    successful quiz is written with a single insert_many.
+
+    `variants` is a list of {"title", "num_questions"} dicts.
+    Returns a list of per-item status dicts in request order.
+    """
+    try:
+        all_cos = json.loads(course_outcomes_json) if course_outcomes_json else []
+    except Exception as e:
+        raise Exception(f"Preprocessing Error: {e}")
+
+    items = []
+    for pdf_file in pdf_files:
+        filename = pdf_file.filename or "document.pdf"
+        try:
+            extracted_text = extract_pdf_text(pdf_file)
+            error = None
+            stage = None
+        except Exception as e:
+            extracted_text = None
+            error = f"Preprocessing Error: {e}"
+            stage = "preprocessing"
+
+        for variant in variants:
+            title = variant.get("title") or "Untitled Quiz"
+            if len(pdf_files) > 1:
+                title = f"{title} - {filename}"
+            items.append({
+                "file": filename,
+                "title": title,
+                "num_questions": variant.get("num_questions") or 10,
+                "text": extracted_text,
+                "error": error,
+                "stage": stage
+            })
+
+    def run(item):
+        prompt = build_quiz_prompt(item["text"], course_id, item["num_questions"], all_cos)
+        return request_quiz_questions(prompt)
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=GROQ_MAX_CONCURRENCY) as executor:
+        for idx, item in enumerate(items):
+            if item["error"] is None:
+                pending[idx] = executor.submit(run, item)
+
+        documents = []
+        for idx, future in pending.items():
+            item = items[idx]
+            try:
+                questions = future.result()
+                documents.append((idx, build_quiz_document(item["title"], course_id, questions, created_by)))
+            except Exception as e:
+                item["error"] = f"Quiz Generation Error: {str(e)}"
+                item["stage"] = "generation"
+
+    inserted_ids = {}
+    if documents:
+        result = quizzes_collection.insert_many([doc for _, doc in documents])
+        inserted_ids = {idx: str(oid) for (idx, _), oid in zip(documents, result.inserted_ids)}
+
+    report = []
+    for idx, item in enumerate(items):
+        entry = {
+            "file": item["file"],
+            "title": item["title"],
+            "num_questions": item["num_questions"]
+        }
+        if idx in inserted_ids:
+            entry["status"] = "ok"
+            entry["quiz_id"] = inserted_ids[idx]
+        else:
+            entry["status"] = "error"
+            entry["error"] = item["error"]
+            entry["stage"] = item["stage"]
+        report.append(entry)
+    return report
+
 def evaluate_quiz(quiz, user_answers):
     """
     Scores the quiz. Handles both index-based answers ("1") and 
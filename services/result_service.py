@@ -0,0 +1,125 @@
+from bson import Binary, ObjectId
+from pymongo import UpdateOne
+from database.mongo import quizzes_collection, quiz_results_collection
+
+
+# Compact result format: instead of copying every question into each result,
+# store the chosen option index per question ("answers") and a correctness
+# bitmap ("correct_bits", bit i = question i). Question text and the correct
+# answer are read back from the quiz document only when details are displayed.
+#
+# An answer entry is the option index when the graded answer is exactly that
+# option's text, None when unanswered, and otherwise the graded string itself,
+# so expansion always shows exactly what evaluate_quiz() compared.
+
+def _choice_index(options, value):
+    # Same normalization as evaluate_quiz(): str() and strip(), nothing more.
+    raw = str(value).strip() if value is not None else ""
+    if raw == "":
+        return None
+    for idx, opt in enumerate(options):
+        if str(opt).strip() == raw:
+            return idx
+    return raw
+
+def _pack_bits(flags):
+    bits = bytearray((len(flags) + 7) // 8)
+    for idx, flag in enumerate(flags):
+        if flag:
+            bits[idx >> 3] |= 1 << (idx & 7)
+    return Binary(bytes(bits))
+
+def _bit(bits, idx):
+    byte = idx >> 3
+    return byte < len(bits) and bool(bits[byte] >> (idx & 7) & 1)
+
+def encode_result_details(quiz, details):
+    """Turns evaluate_quiz() rows into the compact {answers, correct_bits} fields."""
+    questions = quiz.get("questions", [])
+    answers = []
+    for idx, row in enumerate(details):
+        options = questions[idx].get("options", []) if idx < len(questions) else []
+        answers.append(_choice_index(options, row.get("student_answer")))
+    return {
+        "answers": answers,
+        "correct_bits": _pack_bits([row.get("is_correct") for row in details])
+    }
+
+def expand_result_details(result, quiz):
+    """
+    Rebuilds the full per-question details for display. Results written
+    before the compact format keep their stored details and are returned as-is.
+    """
+    if "details" in result:
+        return result["details"]
+
+    questions = quiz.get("questions", []) if quiz else []
+    answers = result.get("answers", [])
+    bits = bytes(result.get("correct_bits") or b"")
+
+    details = []
+    for idx, choice in enumerate(answers):
+        q = questions[idx] if idx < len(questions) else {}
+        options = q.get("options", [])
+        if isinstance(choice, int) and 0 <= choice < len(options):
+            student_answer = str(options[choice]).strip()
+        else:
+            student_answer = "" if choice is None else str(choice)
+        correct_ans = q.get("answer")
+
+        details.append({
+            "question_id": str(idx),
+            "question_text": q.get("question"),
+            "student_answer": student_answer,
+            "correct_answer": str(correct_ans).strip() if correct_ans is not None else "",
+            "is_correct": _bit(bits, idx)
+        })
+    return details
+
+
+# --- MIGRATION ---
+
+def migrate_result_details(batch_size=500):
+    """
+    Rewrites stored results that still carry a full `details` array into the
+    compact format. Grading is preserved from the stored is_correct flags.
+    Results whose quiz no longer exists are left untouched.
+    """
+    quiz_cache = {}
+    ops = []
+    migrated = skipped = 0
+
+    cursor = quiz_results_collection.find(
+        {"details": {"$exists": True}},
+        {"quiz_id": 1, "details": 1}
+    )
+    for res in cursor:
+        key = str(res.get("quiz_id"))
+        if key not in quiz_cache:
+            try:
+                quiz_cache[key] = quizzes_collection.find_one({"_id": ObjectId(key)}, {"questions": 1})
+            except Exception:
+                quiz_cache[key] = None
+        quiz = quiz_cache[key]
+        if not quiz:
+            skipped += 1
+            continue
+
+        compact = encode_result_details(quiz, res.get("details") or [])
+        ops.append(UpdateOne({"_id": res["_id"]}, {"$set": compact, "$unset": {"details": ""}}))
+        if len(ops) >= batch_size:
+            quiz_results_collection.bulk_write(ops, ordered=False)
+            migrated += len(ops)
+            ops = []
+
+    if ops:
+        quiz_results_collection.bulk_write(ops, ordered=False)
+        migrated += len(ops)
+
+    return {"migrated": migrated, "skipped": skipped}
+
+
+if __name__ == "__main__":
+    # Usage: python -m services.result_service
+    summary = migrate_result_details()
+    print(f"✅ Migrated {summary['migrated']} results ({summary['skipped']} skipped: quiz not found)")